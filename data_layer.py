@@ -2,60 +2,87 @@
 Data Access Layer
 This file contains all the functions that interact directly with the database.
 """
-from db import execute_query
+import threading
 
+from cachetools import LRUCache
 
-def insert_product_template(str_id, name, base_price):
-    """Inserts a new product template into the database."""
-    sql = "INSERT INTO ProductTemplate (str_id, name, base_price) VALUES (%s, %s, %s) RETURNING template_id, str_id;"
-    params = (str_id, name, base_price)
-    return execute_query(sql, params, fetch="one")
+from db import copy_rows, execute_prepared, execute_query, execute_values, stream_query, transaction
 
+# Bulk inserts larger than this are loaded with COPY instead of multi-row VALUES.
+BULK_COPY_THRESHOLD = 10_000
 
-def find_template_id_by_str_id(template_str_id):
-    """Finds a product template's UUID from its string ID."""
-    sql = "SELECT template_id FROM ProductTemplate WHERE str_id = %s;"
-    return execute_query(sql, (template_str_id,), fetch="one")
+# Compatibility rules cannot be modified once created, so lookups by id are
+# cached per process. Evict from here if update/delete endpoints are added.
+_rule_cache = LRUCache(maxsize=4096)
+_rule_cache_lock = threading.Lock()
 
 
-def insert_option_category(template_id, str_id, name):
-    """Inserts a new option category linked to a template."""
-    sql = "INSERT INTO OptionCategory (template_id, str_id, name) VALUES (%s, %s, %s) RETURNING category_id, str_id;"
-    params = (template_id, str_id, name)
-    return execute_query(sql, params, fetch="one")
+def insert_product_template(str_id, name, base_price):
+    """Inserts a new product template into the database."""
+    sql = "INSERT INTO ProductTemplate (str_id, name, base_price) VALUES ($1, $2, $3) RETURNING template_id, str_id;"
+    params = (str_id, name, base_price)
+    return execute_prepared("insert_product_template", sql, ("text", "text", "numeric"), params, fetch="one")
 
 
-def find_category_id_by_str_id(category_str_id):
-    """Finds an option category's UUID from its string ID."""
-    sql = "SELECT category_id FROM OptionCategory WHERE str_id = %s;"
-    return execute_query(sql, (category_str_id,), fetch="one")
+def insert_option_category(template_str_id, str_id, name):
+    """
+    Inserts a new option category linked to a template, resolving the template
+    from its string ID in the same statement.
+    Returns None if the template does not exist.
+    """
+    sql = """
+        INSERT INTO OptionCategory (template_id, str_id, name)
+        SELECT template_id, $1, $2 FROM ProductTemplate WHERE str_id = $3
+        RETURNING category_id, str_id;
+    """
+    params = (str_id, name, template_str_id)
+    return execute_prepared("insert_option_category", sql, ("text", "text", "text"), params, fetch="one")
 
 
-def insert_option_choice(category_id, str_id, name, price_delta):
-    """Inserts a new option choice linked to a category."""
-    sql = "INSERT INTO OptionChoice (category_id, str_id, name, price_delta) VALUES (%s, %s, %s, %s) RETURNING choice_id, str_id;"
-    params = (category_id, str_id, name, price_delta)
-    return execute_query(sql, params, fetch="one")
+def insert_option_choice(category_str_id, str_id, name, price_delta):
+    """
+    Inserts a new option choice linked to a category, resolving the category
+    from its string ID in the same statement.
+    Returns None if the category does not exist.
+    """
+    # Category str_ids are only unique per template; LIMIT 1 keeps this to a
+    # single insert, matching the previous lookup-then-insert behaviour.
+    sql = """
+        INSERT INTO OptionChoice (category_id, str_id, name, price_delta)
+        SELECT category_id, $1, $2, $3 FROM OptionCategory WHERE str_id = $4 LIMIT 1
+        RETURNING choice_id, str_id;
+    """
+    params = (str_id, name, price_delta, category_str_id)
+    return execute_prepared("insert_option_choice", sql, ("text", "text", "numeric", "text"), params, fetch="one")
 
 
 def find_choices_for_rule(template_str_id, primary_str_id, secondary_str_id):
-    """Finds two choices ensuring they belong to the same product template."""
+    """
+    Finds two choices ensuring they belong to the same product template.
+    Returns a single row with primary_id and secondary_id, plus primary_found and
+    secondary_found: how many choices in the template match each str_id (choice
+    str_ids are only unique per category, so a side can match more than once).
+    """
     sql = """
-        SELECT oc.choice_id, oc.str_id
+        SELECT
+            (array_agg(oc.choice_id) FILTER (WHERE oc.str_id = $2))[1] AS primary_id,
+            (array_agg(oc.choice_id) FILTER (WHERE oc.str_id = $3))[1] AS secondary_id,
+            count(*) FILTER (WHERE oc.str_id = $2) AS primary_found,
+            count(*) FILTER (WHERE oc.str_id = $3) AS secondary_found
         FROM OptionChoice oc
         JOIN OptionCategory cat ON oc.category_id = cat.category_id
         JOIN ProductTemplate pt ON cat.template_id = pt.template_id
-        WHERE pt.str_id = %s AND oc.str_id IN (%s, %s);
+        WHERE pt.str_id = $1 AND oc.str_id IN ($2, $3);
     """
     params = (template_str_id, primary_str_id, secondary_str_id)
-    return execute_query(sql, params, fetch="all")
+    return execute_prepared("find_choices_for_rule", sql, ("text", "text", "text"), params, fetch="one")
 
 
 def insert_compatibility_rule(rule_type, primary_id, secondary_id):
     """Inserts a new compatibility rule."""
-    sql = "INSERT INTO CompatibilityRule (rule_type, primary_choice_id, secondary_choice_id) VALUES (%s, %s, %s) RETURNING rule_id;"
+    sql = "INSERT INTO CompatibilityRule (rule_type, primary_choice_id, secondary_choice_id) VALUES ($1, $2, $3) RETURNING rule_id;"
     params = (rule_type, primary_id, secondary_id)
-    return execute_query(sql, params, fetch="one")
+    return execute_prepared("insert_compatibility_rule", sql, ("rule_type_enum", "uuid", "uuid"), params, fetch="one")
 
 
 def find_compatibility_rule_by_id(rule_id):
@@ -68,58 +95,91 @@ def find_compatibility_rule_by_id(rule_id):
         FROM CompatibilityRule cr
         JOIN OptionChoice pc ON cr.primary_choice_id = pc.choice_id
         JOIN OptionChoice sc ON cr.secondary_choice_id = sc.choice_id
-        WHERE cr.rule_id = %s;
+        WHERE cr.rule_id = $1;
     """
-    return execute_query(sql, (str(rule_id),), fetch="one")
+    with _rule_cache_lock:
+        rule = _rule_cache.get(rule_id)
+    if rule is not None:
+        return rule
+    rule = execute_prepared("find_compatibility_rule_by_id", sql, ("uuid",), (rule_id,), fetch="one")
+    # Misses are not cached so a rule created later is found immediately.
+    if rule is not None:
+        with _rule_cache_lock:
+            _rule_cache[rule_id] = rule
+    return rule
 
 
-def find_target_choices(template_str_id, category_str_id):
-    """Finds all choices for a given category within a template."""
-    sql = """
-        SELECT oc.choice_id, oc.str_id, oc.name, oc.price_delta, oc.category_id
-        FROM OptionChoice oc
-        JOIN OptionCategory ocat ON oc.category_id = ocat.category_id
-        JOIN ProductTemplate pt ON ocat.template_id = pt.template_id
-        WHERE pt.str_id = %s AND ocat.str_id = %s;
+def stream_available_options(template_str_id, category_str_id, current_selections):
     """
-    return execute_query(sql, (template_str_id, category_str_id), fetch="all")
-
-
-def find_selected_choice_uuids(selection_pairs):
-    """Finds the UUIDs of currently selected choices."""
-    sql = """
-        SELECT oc.choice_id FROM OptionChoice oc
-        JOIN OptionCategory ocat ON oc.category_id = ocat.category_id
-        WHERE (ocat.str_id, oc.str_id) IN %s;
+    Computes the available choices for a category given the current selections.
+    Yields batches of choices, each already encoded as JSON text by PostgreSQL,
+    read through a server-side cursor so memory stays bounded by the batch size.
+    Current selections is a dict of {category_str_id: choice_str_id}. If none of
+    them match a choice in the template, every choice in the category is returned.
     """
-    return execute_query(sql, (tuple(selection_pairs),), fetch="all")
-
-
-def find_incompatible_uuids(selected_uuids):
-    """Finds all choice UUIDs that are incompatible with the current selection."""
-    sql = """
-        SELECT primary_choice_id AS choice_id FROM CompatibilityRule WHERE rule_type = 'INCOMPATIBLE_WITH' AND secondary_choice_id = ANY(%s)
-        UNION
-        SELECT secondary_choice_id AS choice_id FROM CompatibilityRule WHERE rule_type = 'INCOMPATIBLE_WITH' AND primary_choice_id = ANY(%s);
-    """
-    results = execute_query(sql, (selected_uuids, selected_uuids), fetch="all")
-    return {row['choice_id'] for row in results}
-
-
-def find_required_choices(selected_uuids):
-    """Finds all choices that are required by the current selection."""
     sql = """
-        SELECT cr.secondary_choice_id, oc.category_id
-        FROM CompatibilityRule cr JOIN OptionChoice oc ON cr.secondary_choice_id = oc.choice_id
-        WHERE cr.rule_type = 'REQUIRES' AND cr.primary_choice_id = ANY(%s);
+        WITH targets AS (
+            SELECT oc.choice_id, oc.str_id, oc.name, oc.price_delta, oc.category_id
+            FROM OptionChoice oc
+            JOIN OptionCategory ocat ON oc.category_id = ocat.category_id
+            JOIN ProductTemplate pt ON ocat.template_id = pt.template_id
+            WHERE pt.str_id = %(template_str_id)s AND ocat.str_id = %(category_str_id)s
+        ),
+        selected AS (
+            SELECT oc.choice_id
+            FROM OptionChoice oc
+            JOIN OptionCategory ocat ON oc.category_id = ocat.category_id
+            JOIN ProductTemplate pt ON ocat.template_id = pt.template_id
+            JOIN unnest(%(category_str_ids)s::text[], %(choice_str_ids)s::text[]) AS s(category_str_id, choice_str_id)
+                ON ocat.str_id = s.category_str_id AND oc.str_id = s.choice_str_id
+            WHERE pt.str_id = %(template_str_id)s
+        ),
+        incompatible AS (
+            SELECT r.primary_choice_id AS choice_id
+            FROM CompatibilityRule r JOIN selected s ON r.secondary_choice_id = s.choice_id
+            WHERE r.rule_type = 'INCOMPATIBLE_WITH'
+            UNION
+            SELECT r.secondary_choice_id AS choice_id
+            FROM CompatibilityRule r JOIN selected s ON r.primary_choice_id = s.choice_id
+            WHERE r.rule_type = 'INCOMPATIBLE_WITH'
+        ),
+        -- Only requirements that land in the target category constrain it,
+        -- i.e. those whose required choice is one of the targets.
+        required AS (
+            SELECT r.secondary_choice_id AS choice_id
+            FROM CompatibilityRule r
+            JOIN selected s ON r.primary_choice_id = s.choice_id
+            JOIN targets t ON r.secondary_choice_id = t.choice_id
+            WHERE r.rule_type = 'REQUIRES'
+        )
+        SELECT (CASE
+            WHEN NOT EXISTS (SELECT 1 FROM selected) THEN row_to_json(t)
+            ELSE json_build_object('str_id', t.str_id, 'name', t.name, 'price_delta', t.price_delta::float8)
+        END)::text AS option
+        FROM targets t
+        WHERE NOT EXISTS (SELECT 1 FROM selected)
+           OR (t.choice_id NOT IN (SELECT choice_id FROM incompatible)
+               AND (NOT EXISTS (SELECT 1 FROM required)
+                    OR t.choice_id IN (SELECT choice_id FROM required)));
     """
-    return execute_query(sql, (selected_uuids,), fetch="all")
+    params = {
+        "template_str_id": template_str_id,
+        "category_str_id": category_str_id,
+        "category_str_ids": list(current_selections.keys()),
+        "choice_str_ids": list(current_selections.values()),
+    }
+    batches = stream_query(sql, params, name="available_options")
+    try:
+        for batch in batches:
+            yield [row['option'] for row in batch]
+    finally:
+        batches.close()
 
 
 def find_template_details(template_str_id):
     """Finds a template's base price and UUID by its string ID."""
-    sql = "SELECT template_id, base_price FROM ProductTemplate WHERE str_id = %s;"
-    return execute_query(sql, (template_str_id,), fetch="one")
+    sql = "SELECT template_id, base_price FROM ProductTemplate WHERE str_id = $1;"
+    return execute_prepared("find_template_details", sql, ("text",), (template_str_id,), fetch="one")
 
 
 def find_choices_from_selection(template_id, selections):
@@ -129,17 +189,22 @@ def find_choices_from_selection(template_id, selections):
     """
     if not selections:
         return []
-    # Create a list of tuples for the WHERE IN clause
-    selection_pairs = tuple(selections.items())
+    # The pairs are sent as two parallel arrays and unnested into a relation
+    # the planner can join against.
+    category_str_ids = list(selections.keys())
+    choice_str_ids = list(selections.values())
     sql = """
         SELECT
             oc.choice_id, oc.str_id, oc.name, oc.price_delta,
             ocat.category_id, ocat.str_id as category_str_id, ocat.name as category_name
         FROM OptionChoice oc
         JOIN OptionCategory ocat ON oc.category_id = ocat.category_id
-        WHERE ocat.template_id = %s AND (ocat.str_id, oc.str_id) IN %s;
+        JOIN unnest($1::text[], $2::text[]) AS s(category_str_id, choice_str_id)
+            ON ocat.str_id = s.category_str_id AND oc.str_id = s.choice_str_id
+        WHERE ocat.template_id = $3;
     """
-    return execute_query(sql, (template_id, selection_pairs), fetch="all")
+    params = (category_str_ids, choice_str_ids, template_id)
+    return execute_prepared("find_choices_from_selection", sql, ("text[]", "text[]", "uuid"), params, fetch="all")
 
 
 def find_all_rules_for_template(template_id):
@@ -158,6 +223,116 @@ def find_all_rules_for_template(template_id):
         JOIN OptionChoice p ON r.primary_choice_id = p.choice_id
         JOIN OptionChoice s ON r.secondary_choice_id = s.choice_id
         JOIN OptionCategory pcat ON p.category_id = pcat.category_id
-        WHERE pcat.template_id = %s;
+        WHERE pcat.template_id = $1;
+    """
+    return execute_prepared("find_all_rules_for_template", sql, ("uuid",), (template_id,), fetch="all")
+
+
+def _bulk_insert(insert_sql, columns, rows, staging_table):
+    """
+    Runs insert_sql, an INSERT reading from the relation "v" with the
+    given (name, type) columns, over all rows.
+    Batches up to BULK_COPY_THRESHOLD rows are sent as paged multi-row VALUES;
+    larger ones are COPYed into a temporary staging table first.
+    """
+    names = [name for name, _ in columns]
+    if len(rows) <= BULK_COPY_THRESHOLD:
+        source = f"(VALUES %s) AS v ({', '.join(names)})"
+        template = "(" + ", ".join(f"%s::{type_}" for _, type_ in columns) + ")"
+        return execute_values(insert_sql.format(source=source), rows, template=template)
+
+    column_defs = ", ".join(f"{name} {type_}" for name, type_ in columns)
+    with transaction():
+        execute_query(f"CREATE TEMP TABLE {staging_table} ({column_defs}) ON COMMIT DROP;")
+        copy_rows(staging_table, names, rows)
+        return execute_query(insert_sql.format(source=f"{staging_table} AS v"), fetch="all")
+
+
+def bulk_insert_product_templates(rows):
+    """
+    Inserts many product templates at once.
+    Rows are (str_id, name, base_price) tuples.
+    """
+    sql = """
+        INSERT INTO ProductTemplate (str_id, name, base_price)
+        SELECT v.str_id, v.name, v.base_price FROM {source}
+        RETURNING template_id, str_id;
+    """
+    columns = [("str_id", "text"), ("name", "text"), ("base_price", "numeric")]
+    return _bulk_insert(sql, columns, rows, "bulk_product_template")
+
+
+def bulk_insert_option_categories(rows):
+    """
+    Inserts many option categories at once, resolving templates by string ID.
+    Rows are (template_str_id, str_id, name) tuples; rows whose template does
+    not exist are skipped.
+    """
+    sql = """
+        INSERT INTO OptionCategory (template_id, str_id, name)
+        SELECT pt.template_id, v.str_id, v.name FROM {source}
+        JOIN ProductTemplate pt ON pt.str_id = v.template_str_id
+        RETURNING category_id, str_id;
+    """
+    columns = [("template_str_id", "text"), ("str_id", "text"), ("name", "text")]
+    return _bulk_insert(sql, columns, rows, "bulk_option_category")
+
+
+def bulk_insert_option_choices(rows):
+    """
+    Inserts many option choices at once, resolving categories by string ID
+    within their template.
+    Rows are (template_str_id, category_str_id, str_id, name, price_delta)
+    tuples; rows that do not resolve to exactly one category are skipped.
+    """
+    # Each input row is numbered so a row matching several categories is
+    # dropped rather than inserted once per match.
+    sql = """
+        WITH numbered AS (
+            SELECT row_number() OVER () AS ord, v.* FROM {source}
+        ), matches AS (
+            SELECT ocat.category_id, n.str_id, n.name, n.price_delta,
+                   count(*) OVER (PARTITION BY n.ord) AS match_count
+            FROM numbered n
+            JOIN ProductTemplate pt ON pt.str_id = n.template_str_id
+            JOIN OptionCategory ocat ON ocat.template_id = pt.template_id AND ocat.str_id = n.category_str_id
+        )
+        INSERT INTO OptionChoice (category_id, str_id, name, price_delta)
+        SELECT category_id, str_id, name, price_delta FROM matches WHERE match_count = 1
+        RETURNING choice_id, str_id;
+    """
+    columns = [("template_str_id", "text"), ("category_str_id", "text"), ("str_id", "text"),
+               ("name", "text"), ("price_delta", "numeric")]
+    return _bulk_insert(sql, columns, rows, "bulk_option_choice")
+
+
+def bulk_insert_compatibility_rules(rows):
+    """
+    Inserts many compatibility rules at once, resolving both choices by string
+    ID within the template.
+    Rows are (template_str_id, rule_type, primary_str_id, secondary_str_id)
+    tuples; rows that do not resolve to exactly one choice on each side, as
+    when a str_id is missing or used in several categories, are skipped.
+    """
+    # A row's match count is (primary matches) x (secondary matches), so it is
+    # 1 only when both sides are unambiguous, as in find_choices_for_rule.
+    sql = """
+        WITH numbered AS (
+            SELECT row_number() OVER () AS ord, v.* FROM {source}
+        ), matches AS (
+            SELECT n.rule_type, p.choice_id AS primary_id, s.choice_id AS secondary_id,
+                   count(*) OVER (PARTITION BY n.ord) AS match_count
+            FROM numbered n
+            JOIN ProductTemplate pt ON pt.str_id = n.template_str_id
+            JOIN OptionCategory pcat ON pcat.template_id = pt.template_id
+            JOIN OptionChoice p ON p.category_id = pcat.category_id AND p.str_id = n.primary_str_id
+            JOIN OptionCategory scat ON scat.template_id = pt.template_id
+            JOIN OptionChoice s ON s.category_id = scat.category_id AND s.str_id = n.secondary_str_id
+        )
+        INSERT INTO CompatibilityRule (rule_type, primary_choice_id, secondary_choice_id)
+        SELECT rule_type, primary_id, secondary_id FROM matches WHERE match_count = 1
+        RETURNING rule_id;
     """
-    return execute_query(sql, (template_id,), fetch="all")
\ No newline at end of file
+    columns = [("template_str_id", "text"), ("rule_type", "rule_type_enum"),
+               ("primary_str_id", "text"), ("secondary_str_id", "text")]
+    return _bulk_insert(sql, columns, rows, "bulk_compatibility_rule")
@@ -1,21 +1,59 @@
+import atexit
+import io
+import os
+from contextlib import contextmanager
+
+import click
 import psycopg2
 import psycopg2.extras
+import psycopg2.pool
 from flask import g, current_app
+from flask.cli import AppGroup
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+db_cli = AppGroup('db', help='Database management commands.')
+
+class PreparingConnection(psycopg2.extensions.connection):
+    """Connection that remembers which server-side prepared statements it holds."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
 
 def get_db():
     """
-    Opens a new database connection if there is none yet for the
-    current application context.
+    Checks out a connection from the application's pool if there is none
+    yet for the current application context.
     """
     if 'db' not in g:
-        g.db = psycopg2.connect(current_app.config['SQLALCHEMY_DATABASE_URI'], cursor_factory=psycopg2.extras.DictCursor)
+        g.db = current_app.extensions['db_pool'].getconn()
     return g.db
 
+def get_cursor():
+    """
+    Returns a cursor that is reused by every query in the current application
+    context, instead of creating one per query.
+    """
+    if 'cur' not in g:
+        g.cur = get_db().cursor()
+    return g.cur
+
 def close_db(e=None):
-    """Closes the database connection at the end of the request."""
+    """Returns the database connection to the pool at the end of the request."""
+    cur = g.pop('cur', None)
+    if cur is not None and not cur.closed:
+        cur.close()
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        pool = current_app.extensions['db_pool']
+        if db.closed:
+            pool.putconn(db, close=True)
+            return
+        # Never hand a connection with an open transaction back to the pool.
+        if db.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            db.rollback()
+        pool.putconn(db)
 
 def execute_query(query, params=None, fetch=None):
     """
@@ -26,21 +64,177 @@ def execute_query(query, params=None, fetch=None):
     :return: Query result or None.
     """
     conn = get_db()
+    # Inside transaction() the commit/rollback is left to the context manager.
+    in_transaction = g.get('in_transaction', False)
+    try:
+        cur = get_cursor()
+        cur.execute(query, params or ())
+        result = None
+        if fetch == "one":
+            result = cur.fetchone()
+        elif fetch == "all":
+            result = cur.fetchall()
+        if not in_transaction:
+            conn.commit()
+        return result
+    except psycopg2.Error:
+        if conn and not in_transaction:
+            conn.rollback()
+        raise
+
+def execute_prepared(name, query, argtypes, params=(), fetch=None):
+    """
+    Executes a query as a server-side prepared statement, so PostgreSQL parses
+    and plans it once per connection instead of on every call.
+    :param name: Statement name, unique per query.
+    :param query: SQL query string with positional placeholders ($1, $2, ...).
+    :param argtypes: PostgreSQL type names of the placeholders, in order.
+    :param params: Tuple of parameters to substitute into the query.
+    :param fetch: "one" to fetch a single result, "all" to fetch all results.
+    :return: Query result or None.
+    """
+    conn = get_db()
+    if name not in conn.prepared_statements:
+        # Prepared statements live for the whole session, not the transaction,
+        # so this only runs the first time a pooled connection sees the query.
+        execute_query(f"PREPARE {name} ({', '.join(argtypes)}) AS {query.strip().rstrip(';')};")
+        conn.prepared_statements.add(name)
+    args = f" ({', '.join(['%s'] * len(params))})" if params else ""
+    return execute_query(f"EXECUTE {name}{args};", params, fetch=fetch)
+
+def stream_query(query, params=None, name="stream", itersize=256):
+    """
+    Executes a query on a server-side (named) cursor and yields its rows in
+    lists of up to itersize, so large results are never held in memory at once.
+    The generator checks out its own pooled connection and returns it when it
+    finishes or is closed, since a streamed response is consumed after the
+    request's connection has already been released by close_db.
+    :param query: SQL query string with placeholders (%s).
+    :param params: Tuple or dict of parameters to substitute into the query.
+    :param name: Name of the server-side cursor.
+    :param itersize: Number of rows fetched from the server per batch.
+    """
+    pool = current_app.extensions['db_pool']
+    conn = pool.getconn()
     try:
-        with conn.cursor() as cur:
+        with conn.cursor(name=name) as cur:
             cur.execute(query, params or ())
-            result = None
-            if fetch == "one":
-                result = cur.fetchone()
-            elif fetch == "all":
-                result = cur.fetchall()
+            while True:
+                rows = cur.fetchmany(itersize)
+                if not rows:
+                    break
+                yield rows
+        conn.commit()
+    finally:
+        if conn.closed:
+            pool.putconn(conn, close=True)
+        else:
+            # Covers errors and consumers that stop iterating early.
+            if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            pool.putconn(conn)
+
+def execute_values(query, rows, template=None, page_size=1000):
+    """
+    Executes a multi-row INSERT for many rows in pages of page_size.
+    :param query: SQL query string containing a single "VALUES %s" placeholder.
+    :param rows: Sequence of parameter tuples, one per row.
+    :param template: Optional per-row template, e.g. "(%s, %s::numeric)".
+    :return: The rows produced by the query's RETURNING clause.
+    """
+    conn = get_db()
+    in_transaction = g.get('in_transaction', False)
+    try:
+        result = psycopg2.extras.execute_values(
+            get_cursor(), query, rows, template=template, page_size=page_size, fetch=True)
+        if not in_transaction:
             conn.commit()
-            return result
+        return result
     except psycopg2.Error:
-        if conn:
+        if conn and not in_transaction:
             conn.rollback()
         raise
 
+def _copy_csv_field(value):
+    """Encodes one value for COPY ... CSV: None as the unquoted NULL marker, anything else quoted."""
+    if value is None:
+        return '\\N'
+    return '"' + str(value).replace('"', '""') + '"'
+
+def copy_rows(table, columns, rows):
+    """
+    Streams rows into a table with COPY ... FROM STDIN, the fastest load path
+    for large batches.
+    :param table: Name of the table to load into.
+    :param columns: Column names, in the same order as each row's values.
+    :param rows: Iterable of value tuples. None is loaded as NULL; every other
+        value, including the empty string, is loaded as-is.
+    """
+    # Non-NULL values are always quoted, so an empty string never matches the
+    # NULL marker the way an unquoted empty CSV field would.
+    buf = io.StringIO()
+    for row in rows:
+        buf.write(','.join(_copy_csv_field(value) for value in row))
+        buf.write('\n')
+    buf.seek(0)
+    conn = get_db()
+    in_transaction = g.get('in_transaction', False)
+    try:
+        get_cursor().copy_expert(
+            f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf)
+        if not in_transaction:
+            conn.commit()
+    except psycopg2.Error:
+        if conn and not in_transaction:
+            conn.rollback()
+        raise
+
+@contextmanager
+def transaction():
+    """
+    Runs every execute_query call inside the block as a single transaction,
+    committed once on exit and rolled back if the block raises.
+    Yields the context's shared cursor.
+    """
+    if g.get('in_transaction', False):
+        # Nested use joins the enclosing transaction.
+        yield get_cursor()
+        return
+
+    conn = get_db()
+    g.in_transaction = True
+    try:
+        yield get_cursor()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        g.in_transaction = False
+
+@db_cli.command('init-indexes')
+def init_indexes_command():
+    """Create the covering indexes used by the API's lookup queries."""
+    with open(os.path.join(MIGRATIONS_DIR, '002_indexes.sql')) as f:
+        execute_query(f.read())
+    click.echo('Indexes created.')
+
 def init_app(app):
-    """Register database functions with the Flask app."""
-    app.teardown_appcontext(close_db)
\ No newline at end of file
+    """Create the connection pool and register database functions with the Flask app."""
+    # Bind uuid.UUID parameters natively and return UUID columns as uuid.UUID.
+    psycopg2.extras.register_uuid()
+    pool = psycopg2.pool.ThreadedConnectionPool(
+        minconn=int(os.environ.get('DB_POOL_MIN', 5)),
+        maxconn=int(os.environ.get('DB_POOL_MAX', 25)),
+        dsn=app.config['SQLALCHEMY_DATABASE_URI'],
+        connection_factory=PreparingConnection,
+        cursor_factory=psycopg2.extras.RealDictCursor,
+        # Keep long-idle pooled connections from being silently dropped by
+        # firewalls/NAT between the app and the database.
+        keepalives=1,
+        keepalives_idle=int(os.environ.get('DB_KEEPALIVES_IDLE', 60)),
+    )
+    app.extensions['db_pool'] = pool
+    atexit.register(pool.closeall)
+    app.teardown_appcontext(close_db)
+    app.cli.add_command(db_cli)
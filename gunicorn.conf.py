@@ -0,0 +1,22 @@
+"""
+Gunicorn configuration for serving the API in production:
+    gunicorn -c gunicorn.conf.py main:app
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+
+# Requests spend most of their time waiting on PostgreSQL, so each worker
+# process serves many of them concurrently on threads.
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+
+# Every in-flight request holds one pooled connection; more threads than the
+# pool's DB_POOL_MAX would make requests fail with "connection pool exhausted".
+_pool_max = int(os.environ.get('DB_POOL_MAX', 25))
+threads = min(int(os.environ.get('GUNICORN_THREADS', _pool_max)), _pool_max)
+
+# The connection pool is created in init_app and must not be shared across
+# forked workers, so the app is loaded in each worker rather than the master.
+preload_app = False
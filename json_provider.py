@@ -0,0 +1,33 @@
+"""
+Flask JSON provider backed by orjson.
+Responses are encoded straight to bytes, skipping the str round-trip of the
+stdlib-based default provider.
+"""
+import decimal
+
+import orjson
+from flask.json.provider import JSONProvider
+
+
+def _default(o):
+    """Serializes types orjson does not handle natively."""
+    if isinstance(o, decimal.Decimal):
+        return float(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider that uses orjson for encoding and decoding."""
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS),
+            mimetype=self.mimetype)
@@ -1,10 +1,12 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import psycopg2
 import data_layer
-from db import init_app
+from db import init_app, transaction
+from json_provider import OrjsonProvider
 
 # Initialize the Flask application
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Load configuration from config.py
 app.config.from_object('config.Config')
@@ -44,17 +46,15 @@ def create_option_category(template_str_id):
         return jsonify({"error": "Request must include 'category_str_id' and 'name'"}), 400
 
     try:
-        # First, find the template's UUID from its str_id
-        template = data_layer.find_template_id_by_str_id(template_str_id)
-        if not template:
-            return jsonify({"error": f"Product template with id '{template_str_id}' not found."}), 404
-
+        # The template is resolved from its str_id as part of the insert.
         new_category = data_layer.insert_option_category(
-            template['template_id'], data['category_str_id'], data['name'])
+            template_str_id, data['category_str_id'], data['name'])
+        if not new_category:
+            return jsonify({"error": f"Product template with id '{template_str_id}' not found."}), 404
 
         return jsonify({"category_id": str(new_category['category_id']), "category_str_id": new_category['str_id']}), 201
     except psycopg2.Error as e:
-        # This can fail if template_id doesn't exist or if the category name is a duplicate for this template.
+        # This can fail if the category name is a duplicate for this template.
         return jsonify({"error": "Database error", "detail": str(e)}), 409
 
 # 3. POST /option-categories/<category_str_id>/choices
@@ -66,19 +66,17 @@ def create_option_choice(category_str_id):
         return jsonify({"error": "Request must include 'choice_str_id', 'name', and 'price_delta'"}), 400
 
     try:
-        # First, find the category's UUID from its str_id
+        # The category is resolved from its str_id as part of the insert.
         # Note: category str_ids are only unique per template, but we'll assume for now they are globally unique for this endpoint.
         # A more robust solution might be /product-templates/{tid}/categories/{cid}/choices
-        category = data_layer.find_category_id_by_str_id(category_str_id)
-        if not category:
-            return jsonify({"error": f"Option category with id '{category_str_id}' not found."}), 404
-
         new_choice = data_layer.insert_option_choice(
-            category['category_id'], data['choice_str_id'], data['name'], data['price_delta'])
+            category_str_id, data['choice_str_id'], data['name'], data['price_delta'])
+        if not new_choice:
+            return jsonify({"error": f"Option category with id '{category_str_id}' not found."}), 404
 
         return jsonify({"choice_id": str(new_choice['choice_id']), "choice_str_id": new_choice['str_id']}), 201
     except psycopg2.Error as e:
-        # This can fail if category_id doesn't exist or if the choice name is a duplicate for this category.
+        # This can fail if the choice name is a duplicate for this category.
         return jsonify({"error": "Database error", "detail": str(e)}), 409
 
 # --- Milestone 1: Add Compatibility Rule ---
@@ -101,22 +99,20 @@ def create_compatibility_rule(template_str_id):
         return jsonify({"error": "A choice cannot have a compatibility rule with itself."}), 400
 
     try:
-        # This query ensures both choices exist and belong to the specified product template.
-        # It's a crucial validation step to prevent creating rules across different products.
-        choices = data_layer.find_choices_for_rule(
-            template_str_id, primary_choice_str_id, secondary_choice_str_id)
+        # The lookup and the insert share one transaction (and one commit).
+        with transaction():
+            # This query ensures both choices exist and belong to the specified product template.
+            # It's a crucial validation step to prevent creating rules across different products.
+            choices = data_layer.find_choices_for_rule(
+                template_str_id, primary_choice_str_id, secondary_choice_str_id)
 
-        if len(choices) != 2:
-            return jsonify({"error": "One or both choice IDs are invalid or do not belong to this product template."}), 404
+            # Each side must resolve to exactly one choice in the template.
+            if choices['primary_found'] != 1 or choices['secondary_found'] != 1:
+                return jsonify({"error": "One or both choice IDs are invalid or do not belong to this product template."}), 404
 
-        # Map str_ids back to the UUIDs found in the database
-        choice_map = {choice['str_id']: choice['choice_id'] for choice in choices}
-        primary_choice_id = choice_map[primary_choice_str_id]
-        secondary_choice_id = choice_map[secondary_choice_str_id]
-
-        # Insert the rule
-        new_rule = data_layer.insert_compatibility_rule(
-            rule_type, primary_choice_id, secondary_choice_id)
+            # Insert the rule
+            new_rule = data_layer.insert_compatibility_rule(
+                rule_type, choices['primary_id'], choices['secondary_id'])
 
         return jsonify({"message": "Compatibility rule added successfully.", "rule_id": str(new_rule['rule_id'])}), 201
 
@@ -137,6 +133,14 @@ def get_compatibility_rule(rule_id):
         return jsonify({"error": "Database error", "detail": str(e)}), 500
 
 # --- Milestone 2: Get Available Options ---
+def _json_array(first_batch, batches):
+    """Yields a JSON array built from batches of already-encoded JSON values."""
+    yield '['
+    yield ','.join(first_batch)
+    for batch in batches:
+        yield ',' + ','.join(batch)
+    yield ']'
+
 @app.route('/product-templates/<string:template_str_id>/available-options/<string:target_category_str_id>', methods=['POST'])
 def get_available_options(template_str_id, target_category_str_id):
     """
@@ -148,51 +152,26 @@ def get_available_options(template_str_id, target_category_str_id):
         data = {}
 
     current_selections = data.get('current_selections', {})
+    if not isinstance(current_selections, dict):
+        return jsonify({"error": "'current_selections' must be an object of {category_str_id: choice_str_id}"}), 400
+
+    # Non-string choice ids can never match a choice, so they are dropped here
+    # instead of being shipped to (and rejected by) the database.
+    current_selections = {k: v for k, v in current_selections.items() if isinstance(v, str)}
 
     try:
-        # 1. Get all choices for the target category. This is our potential result set.
-        target_choices = data_layer.find_target_choices(
-            template_str_id, target_category_str_id)
-
-        if not target_choices:
-            # This could mean the template or category is invalid, or the category is empty.
-            # A check could be added to see if the category exists at all.
-            return jsonify([])
-
-        # If there are no selections, all choices in the category are available.
-        if not current_selections:
-            return jsonify([dict(row) for row in target_choices])
-
-        # 2. Get the UUIDs of the currently selected choices.
-        # We build a list of tuples for the IN clause
-        selection_pairs = [(k, v) for k, v in current_selections.items()]
-        selected_results = data_layer.find_selected_choice_uuids(selection_pairs)
-        selected_uuids = [row['choice_id'] for row in selected_results]
-
-        if not selected_uuids:
-            return jsonify([dict(row) for row in target_choices]) # Invalid selections, return all
-
-        # 3. Find all choices that are INCOMPATIBLE with the current selections.
-        incompatible_uuids = data_layer.find_incompatible_uuids(selected_uuids)
-
-        # 4. Find all choices that are REQUIRED by the current selections.
-        required_results = data_layer.find_required_choices(selected_uuids)
-
-        # 5. Filter the initial list of target choices based on the rules.
-        target_category_id = target_choices[0]['category_id']
-        required_in_target_category = {row['secondary_choice_id'] for row in required_results if row['category_id'] == target_category_id}
-
-        available_options = []
-        for choice in target_choices:
-            # A choice is invalid if it's in the incompatible list.
-            if choice['choice_id'] in incompatible_uuids:
-                continue
-            # If this category has requirements, a choice is only valid if it's one of them.
-            if required_in_target_category and choice['choice_id'] not in required_in_target_category:
-                continue
-            available_options.append({"str_id": choice['str_id'], "name": choice['name'], "price_delta": float(choice['price_delta'])})
-
-        return jsonify(available_options)
+        # Selection lookup, rule evaluation and JSON encoding all happen in PostgreSQL;
+        # the encoded choices are streamed to the client batch by batch.
+        batches = data_layer.stream_available_options(
+            template_str_id, target_category_str_id, current_selections)
+        # Pull the first batch here so database errors still map to a 500 response.
+        first_batch = next(batches, [])
+        response = Response(_json_array(first_batch, batches), mimetype='application/json')
+        # The server closes the response even if the body was never iterated,
+        # e.g. when the client disconnects early; that releases the stream's
+        # database connection.
+        response.call_on_close(batches.close)
+        return response
 
     except psycopg2.Error as e:
         return jsonify({"error": "Database error", "detail": str(e)}), 500
@@ -226,11 +205,8 @@ def validate_configuration(template_str_id):
 
         # 2. Perform validation and price calculation
         errors = set()
-        total_price = template['base_price']
-        selected_choice_uuids = {choice['choice_id'] for choice in selected_choices}
-
-        for choice in selected_choices:
-            total_price += choice['price_delta']
+        total_price = template['base_price'] + sum(choice['price_delta'] for choice in selected_choices)
+        selected_choice_uuids = frozenset(choice['choice_id'] for choice in selected_choices)
 
         # 3. Check all rules against the set of selected choices
         for rule in all_rules:
@@ -258,5 +234,61 @@ def validate_configuration(template_str_id):
     except psycopg2.Error as e:
         return jsonify({"error": "Database error", "detail": str(e)}), 500
 
+# --- Bulk seeding ---
+def _rows_from(items, fields):
+    """Turns a list of JSON objects into row tuples, or None if any object lacks a field."""
+    if not isinstance(items, list) or not all(isinstance(item, dict) and all(f in item for f in fields) for item in items):
+        return None
+    return [tuple(item[f] for f in fields) for item in items]
+
+@app.route('/bulk/product-templates', methods=['POST'])
+def bulk_create_product_templates():
+    """Creates many product templates in a single batched insert."""
+    data = request.get_json()
+    fields = ['template_str_id', 'name', 'base_price']
+    rows = _rows_from((data or {}).get('templates'), fields)
+    if rows is None:
+        return jsonify({"error": f"Request must include 'templates', each with {', '.join(fields)}"}), 400
+
+    try:
+        new_templates = data_layer.bulk_insert_product_templates(rows)
+        return jsonify([{"template_id": str(t['template_id']), "template_str_id": t['str_id']} for t in new_templates]), 201
+    except psycopg2.Error as e:
+        return jsonify({"error": "Database error", "detail": str(e)}), 409
+
+@app.route('/bulk/product-templates/<string:template_str_id>/options', methods=['POST'])
+def bulk_create_template_options(template_str_id):
+    """
+    Seeds a template's option categories, choices and compatibility rules in
+    one transaction. Nothing is stored if any row references an unknown or
+    ambiguous template, category or choice.
+    """
+    data = request.get_json() or {}
+    categories = _rows_from(data.get('categories', []), ['category_str_id', 'name'])
+    choices = _rows_from(data.get('choices', []), ['category_str_id', 'choice_str_id', 'name', 'price_delta'])
+    rules = _rows_from(data.get('rules', []), ['rule_type', 'primary_choice_str_id', 'secondary_choice_str_id'])
+    if categories is None or choices is None or rules is None:
+        return jsonify({"error": "Request may include 'categories', 'choices' and 'rules' lists with the same fields as the single-item endpoints"}), 400
+
+    try:
+        with transaction():
+            created = {}
+            for key, rows, insert in (
+                    ('categories', categories, data_layer.bulk_insert_option_categories),
+                    ('choices', choices, data_layer.bulk_insert_option_choices),
+                    ('rules', rules, data_layer.bulk_insert_compatibility_rules)):
+                inserted = insert([(template_str_id, *row) for row in rows]) if rows else []
+                # Each row inserts at most one record, so a shortfall means some
+                # row was missing or ambiguous. Raising rolls back everything
+                # inserted so far.
+                if len(inserted) != len(rows):
+                    raise LookupError(f"Some {key} reference a template, category or choice that does not exist or is ambiguous.")
+                created[key] = len(inserted)
+        return jsonify(created), 201
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    except psycopg2.Error as e:
+        return jsonify({"error": "Database error", "detail": str(e)}), 409
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
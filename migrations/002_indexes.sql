@@ -0,0 +1,26 @@
+-- Covering indexes for the hot lookup paths of the Product Configurator API.
+-- Apply after schema.sql with `flask db init-indexes` (or run it with psql).
+-- INCLUDE columns require PostgreSQL 11+.
+
+BEGIN;
+
+-- ProductTemplate(str_id) is already covered by its UNIQUE constraint.
+
+-- Categories are looked up by (template, str_id); a category str_id is unique per template.
+CREATE UNIQUE INDEX IF NOT EXISTS optioncategory_template_str_id_idx
+    ON OptionCategory (template_id, str_id) INCLUDE (category_id);
+
+-- Lets choice lookups by (category, str_id) return the listed columns from the
+-- index alone. The UNIQUE (category_id, str_id) constraint's index has no
+-- INCLUDE columns, so it can only serve them through heap fetches.
+CREATE UNIQUE INDEX IF NOT EXISTS optionchoice_category_str_id_idx
+    ON OptionChoice (category_id, str_id) INCLUDE (choice_id, name, price_delta);
+
+-- Rules are probed from either side when resolving incompatibilities and requirements.
+CREATE INDEX IF NOT EXISTS compatibilityrule_type_primary_idx
+    ON CompatibilityRule (rule_type, primary_choice_id) INCLUDE (secondary_choice_id);
+
+CREATE INDEX IF NOT EXISTS compatibilityrule_type_secondary_idx
+    ON CompatibilityRule (rule_type, secondary_choice_id) INCLUDE (primary_choice_id);
+
+COMMIT;
@@ -0,0 +1,79 @@
+"""
+Shared fixtures for the API tests.
+The tests run against the PostgreSQL database in DATABASE_URL and are skipped
+when it is not set or not reachable. Missing tables and indexes are created
+from schema.sql and the migrations.
+"""
+import os
+import uuid
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _ensure_schema(dsn):
+    conn = psycopg2.connect(dsn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('producttemplate') IS NOT NULL;")
+            if not cur.fetchone()[0]:
+                for path in ("schema.sql", os.path.join("migrations", "002_indexes.sql")):
+                    with open(os.path.join(ROOT, path)) as f:
+                        cur.execute(f.read())
+        conn.commit()
+    finally:
+        conn.close()
+
+
+@pytest.fixture(scope="session")
+def app():
+    dsn = os.environ.get("DATABASE_URL")
+    if not dsn:
+        pytest.skip("DATABASE_URL is not set")
+    try:
+        _ensure_schema(dsn)
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"database not reachable: {e}")
+
+    from main import app as flask_app
+    flask_app.config.update(TESTING=True)
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def template(client):
+    """Creates a product template with a unique str_id and returns that str_id."""
+    str_id = f"tpl_{uuid.uuid4().hex[:12]}"
+    response = client.post("/product-templates", json={
+        "template_str_id": str_id, "name": f"Template {str_id}", "base_price": 1000})
+    assert response.status_code == 201
+    return str_id
+
+
+@pytest.fixture
+def seed_options(client, template):
+    """
+    Returns a function that seeds the template with 'cpu' and 'ram' categories,
+    the given choices as (category_str_id, choice_str_id) pairs and the given
+    rules as (rule_type, primary_choice_str_id, secondary_choice_str_id) triples.
+    """
+    def seed(choices, rules=()):
+        response = client.post(f"/bulk/product-templates/{template}/options", json={
+            "categories": [{"category_str_id": "cpu", "name": "CPU"},
+                           {"category_str_id": "ram", "name": "RAM"}],
+            "choices": [{"category_str_id": category, "choice_str_id": str_id,
+                         "name": f"{category} {str_id}", "price_delta": i}
+                        for i, (category, str_id) in enumerate(choices)],
+            "rules": [dict(zip(("rule_type", "primary_choice_str_id", "secondary_choice_str_id"), rule))
+                      for rule in rules],
+        })
+        assert response.status_code == 201
+    return seed
@@ -0,0 +1,74 @@
+import json
+
+from werkzeug.test import EnvironBuilder
+
+import data_layer
+
+# intel_i7 rules out ram_0.
+INCOMPATIBLE_RULES = [("INCOMPATIBLE_WITH", "intel_i7", "ram_0")]
+
+
+def _ram_choices(count):
+    """One 'cpu' choice and count 'ram' choices."""
+    return [("cpu", "intel_i7")] + [("ram", f"ram_{i}") for i in range(count)]
+
+
+def test_streams_every_batch_without_selection(client, template, seed_options):
+    # More choices than one server-side cursor batch (256), so several are fetched.
+    seed_options(_ram_choices(600), INCOMPATIBLE_RULES)
+
+    response = client.post(f"/product-templates/{template}/available-options/ram", json={})
+
+    assert response.status_code == 200
+    options = json.loads(response.get_data())
+    assert len(options) == 600
+
+
+def test_streams_filtered_options(client, template, seed_options):
+    seed_options(_ram_choices(600), INCOMPATIBLE_RULES)
+
+    response = client.post(f"/product-templates/{template}/available-options/ram",
+                           json={"current_selections": {"cpu": "intel_i7"}})
+
+    assert response.status_code == 200
+    options = json.loads(response.get_data())
+    assert len(options) == 599
+    assert "ram_0" not in {option["str_id"] for option in options}
+    assert set(options[0]) == {"str_id", "name", "price_delta"}
+
+
+def test_unknown_category_streams_empty_array(client, template):
+    response = client.post(f"/product-templates/{template}/available-options/missing", json={})
+
+    assert response.status_code == 200
+    assert json.loads(response.get_data()) == []
+
+
+def test_repeated_streams_do_not_leak_connections(app, client, template, seed_options):
+    seed_options(_ram_choices(10), INCOMPATIBLE_RULES)
+    pool_size = app.extensions['db_pool'].maxconn
+
+    for _ in range(pool_size + 5):
+        response = client.post(f"/product-templates/{template}/available-options/ram", json={})
+        assert len(json.loads(response.get_data())) == 10
+
+
+def test_closing_an_unread_stream_releases_its_connection(app, client, template, seed_options, monkeypatch):
+    seed_options(_ram_choices(10), INCOMPATIBLE_RULES)
+    pool = app.extensions['db_pool']
+    # Hold on to the stream so it cannot be released by garbage collection,
+    # only by the response being closed.
+    streams = []
+    stream_available_options = data_layer.stream_available_options
+    monkeypatch.setattr(data_layer, "stream_available_options",
+                        lambda *args: streams.append(stream_available_options(*args)) or streams[-1])
+    # Called as a bare WSGI app, since the test client always pulls the first chunk.
+    environ = EnvironBuilder(path=f"/product-templates/{template}/available-options/ram",
+                             method="POST", json={}).get_environ()
+
+    body = app(environ, lambda status, headers: None)
+    assert len(pool._used) == 1
+    # Closed before any chunk is pulled, as on an early disconnect.
+    body.close()
+
+    assert not pool._used
@@ -0,0 +1,39 @@
+import data_layer
+from db import copy_rows, execute_query, transaction
+
+
+def test_copy_rows_keeps_empty_strings_distinct_from_null(app):
+    values = ['', None, 'a "quoted", value', '\\N', 'multi\nline']
+    with app.app_context():
+        with transaction():
+            execute_query("CREATE TEMP TABLE copy_rows_test (idx int, v text) ON COMMIT DROP;")
+            copy_rows('copy_rows_test', ['idx', 'v'], list(enumerate(values)))
+            rows = execute_query("SELECT v FROM copy_rows_test ORDER BY idx;", fetch="all")
+
+    assert [row['v'] for row in rows] == values
+
+
+def test_bulk_categories_copy_path_accepts_empty_name(client, template):
+    categories = [{"category_str_id": f"cat_{i}", "name": f"Category {i}"}
+                  for i in range(data_layer.BULK_COPY_THRESHOLD + 1)]
+    # Category names are unique per template, so only one can be the empty string.
+    categories[0]["name"] = ""
+
+    response = client.post(f"/bulk/product-templates/{template}/options", json={"categories": categories})
+
+    assert response.status_code == 201
+    assert response.get_json()["categories"] == len(categories)
+
+
+def test_bulk_rules_reject_ambiguous_choice_even_when_counts_match(app, client, template, seed_options):
+    seed_options([("cpu", "x"), ("cpu", "dup"), ("ram", "dup")])
+
+    # "dup" matches twice and "missing" not at all, so the row count alone balances out.
+    response = client.post(f"/bulk/product-templates/{template}/options", json={"rules": [
+        {"rule_type": "REQUIRES", "primary_choice_str_id": "x", "secondary_choice_str_id": "dup"},
+        {"rule_type": "REQUIRES", "primary_choice_str_id": "x", "secondary_choice_str_id": "missing"}]})
+
+    assert response.status_code == 404
+    with app.app_context():
+        template_id = data_layer.find_template_details(template)['template_id']
+        assert data_layer.find_all_rules_for_template(template_id) == []
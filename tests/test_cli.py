@@ -0,0 +1,21 @@
+from db import execute_query
+
+
+def test_init_indexes_is_idempotent(app):
+    runner = app.test_cli_runner()
+
+    for _ in range(2):
+        result = runner.invoke(args=["db", "init-indexes"])
+        assert result.exit_code == 0, result.output
+        assert "Indexes created." in result.output
+
+
+def test_init_indexes_creates_covering_choice_index(app):
+    runner = app.test_cli_runner()
+    assert runner.invoke(args=["db", "init-indexes"]).exit_code == 0
+
+    with app.app_context():
+        row = execute_query("SELECT indexdef FROM pg_indexes WHERE indexname = 'optionchoice_category_str_id_idx';",
+                            fetch="one")
+    assert row is not None
+    assert "INCLUDE (choice_id, name, price_delta)" in row["indexdef"]
@@ -0,0 +1,33 @@
+# The same str_id "dup" is used in two categories of the template.
+CHOICES = [("cpu", "intel_i7"), ("ram", "ram_16"), ("cpu", "dup"), ("ram", "dup")]
+
+
+def test_create_and_fetch_rule(client, template, seed_options):
+    seed_options(CHOICES)
+
+    response = client.post(f"/product-templates/{template}/compatibility-rules", json={
+        "rule_type": "REQUIRES", "primary_choice_str_id": "intel_i7", "secondary_choice_str_id": "ram_16"})
+    assert response.status_code == 201
+
+    rule = client.get(f"/compatibility-rules/{response.get_json()['rule_id']}").get_json()
+    assert rule["rule_type"] == "REQUIRES"
+    assert rule["primary_choice_str_id"] == "intel_i7"
+    assert rule["secondary_choice_str_id"] == "ram_16"
+
+
+def test_missing_secondary_is_not_found_even_if_primary_is_duplicated(client, template, seed_options):
+    seed_options(CHOICES)
+
+    response = client.post(f"/product-templates/{template}/compatibility-rules", json={
+        "rule_type": "REQUIRES", "primary_choice_str_id": "dup", "secondary_choice_str_id": "missing"})
+
+    assert response.status_code == 404
+
+
+def test_ambiguous_choice_is_not_found(client, template, seed_options):
+    seed_options(CHOICES)
+
+    response = client.post(f"/product-templates/{template}/compatibility-rules", json={
+        "rule_type": "INCOMPATIBLE_WITH", "primary_choice_str_id": "dup", "secondary_choice_str_id": "intel_i7"})
+
+    assert response.status_code == 404